@@ -1,5 +1,6 @@
 from .voc0712 import VOCDetection
 from .coco import COCODetection
 from .xml_dataset import XMLDetection
-from .data_augment import detection_collate, preproc_for_test
+from .data_augment import detection_collate, preproc_for_test, normalize_for_test
 from .data_prefetcher import DataPrefetcher
+from .eval_dataset import EvalDataset
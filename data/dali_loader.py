@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+from nvidia.dali import pipeline_def, fn, types
+from nvidia.dali.plugin.pytorch import DALIGenericIterator, LastBatchPolicy
+
+
+@pipeline_def
+def _coco_train_pipeline(
+    file_root: str,
+    annotations_file: str,
+    insize: int,
+    mean: list = (0.485, 0.456, 0.406),
+    std: list = (0.229, 0.224, 0.225),
+):
+    (jpegs, bboxes, labels) = fn.readers.coco(
+        file_root=file_root,
+        annotations_file=annotations_file,
+        ltrb=True,
+        ratio=True,
+        skip_empty=True,
+        size_threshold=6.0,
+        random_shuffle=True,
+        name="Reader",
+    )
+
+    # random crop, decoded on the GPU
+    (crop_begin, crop_size, bboxes, labels) = fn.random_bbox_crop(
+        bboxes,
+        labels,
+        aspect_ratio=[0.5, 2.0],
+        thresholds=[0.25, 0.5, 0.75],
+        scaling=[0.25, 1.0],
+        bbox_layout="xyXY",
+        allow_no_crop=True,
+        num_attempts=20,
+    )
+    images = fn.decoders.image_slice(
+        jpegs, crop_begin, crop_size, device="mixed", output_type=types.RGB
+    )
+    images = fn.resize(images, resize_x=insize, resize_y=insize)
+
+    # photometric distortion
+    images = fn.color_twist(
+        images,
+        brightness=fn.random.uniform(range=[0.875, 1.125]),
+        contrast=fn.random.uniform(range=[0.5, 1.5]),
+        saturation=fn.random.uniform(range=[0.5, 1.5]),
+        hue=fn.random.uniform(range=[-18.0, 18.0]),
+    )
+
+    # mirror and normalize
+    flip = fn.random.coin_flip(probability=0.5)
+    bboxes = fn.bb_flip(bboxes, ltrb=True, horizontal=flip)
+    images = fn.crop_mirror_normalize(
+        images,
+        dtype=types.FLOAT,
+        output_layout="CHW",
+        mean=[m * 255.0 for m in mean],
+        std=[s * 255.0 for s in std],
+        mirror=flip,
+    )
+
+    # [x1, y1, x2, y2, label] with 0-based labels, padded with -1 to a dense batch
+    labels = fn.cast(fn.reshape(labels, shape=[-1, 1]), dtype=types.FLOAT) - 1.0
+    targets = fn.pad(fn.cat(bboxes, labels, axis=1), fill_value=-1.0)
+    return (images, targets)
+
+
+class DALICOCOLoader:
+    """COCO training batches decoded and augmented on the GPU by NVIDIA DALI"""
+
+    def __init__(
+        self,
+        root: str,
+        image_set: str,
+        batch_size: int,
+        insize: int,
+        num_threads: int = 4,
+        device_id: int = 0,
+        seed: int = 0,
+    ) -> None:
+        pipe = _coco_train_pipeline(
+            file_root=os.path.join(root, image_set),
+            annotations_file=os.path.join(
+                root, "annotations", "instances_" + image_set + ".json"
+            ),
+            insize=insize,
+            batch_size=batch_size,
+            num_threads=num_threads,
+            device_id=device_id,
+            seed=seed,
+        )
+        pipe.build()
+        self.iterator = DALIGenericIterator(
+            pipe,
+            ["images", "targets"],
+            reader_name="Reader",
+            last_batch_policy=LastBatchPolicy.DROP,
+            auto_reset=True,
+        )
+
+    def __len__(
+        self,
+    ) -> int:
+        return len(self.iterator)
+
+    def next(
+        self,
+    ) -> list:
+        try:
+            batch = next(self.iterator)[0]
+        except StopIteration:
+            batch = next(self.iterator)[0]  # auto_reset starts the next epoch
+        targets = batch["targets"].cuda(non_blocking=True)
+        targets = [t[t[:, -1] >= 0] for t in targets]
+        return batch["images"], targets
@@ -164,6 +164,19 @@ def preproc_for_test(
     return image
 
 
+def normalize_for_test(
+    images: torch.Tensor,
+    out: torch.Tensor,
+    mean: torch.Tensor,
+    std: torch.Tensor,
+) -> torch.Tensor:
+    """Normalize resized uint8 BGR images (N, H, W, C) into out (N, C, H, W)"""
+
+    for c in range(3):  # BGR to RGB, cast in the copy without temporaries
+        out[:, c].copy_(images[..., 2 - c])
+    return out.div_(255.0).sub_(mean).div_(std)
+
+
 def preproc_for_train(
     image: np.ndarray,
     targets: np.ndarray,
@@ -191,13 +204,13 @@ def detection_collate(
 ) -> tuple:
 
     """Custom collate fn for images and boxes"""
-    imgs = []
+    imgs = []  # appended per sample, stacked once per batch
     targets = []
     for sample in batch:
         for tup in sample:
             if torch.is_tensor(tup):
                 imgs.append(tup)
-            elif isinstance(tup, type(np.empty(0))):
+            elif isinstance(tup, np.ndarray):
                 annos = torch.from_numpy(tup).float()
                 annos.requires_grad = False
                 targets.append(annos)
@@ -0,0 +1,35 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import cv2
+import numpy as np
+import torch
+import torch.utils.data as data
+
+
+class EvalDataset(data.Dataset):
+    """Wrap a detection dataset to yield resized uint8 images for evaluation"""
+
+    def __init__(
+        self,
+        dataset: data.Dataset,
+        size: int,
+    ) -> None:
+        self.dataset = dataset
+        self.size = size
+
+    def __getitem__(
+        self,
+        index: int,
+    ) -> list:
+        img = self.dataset.pull_image(index)
+        scale = np.array(
+            [img.shape[1], img.shape[0], img.shape[1], img.shape[0]], dtype=np.float32
+        )
+        img = torch.from_numpy(cv2.resize(img, (self.size, self.size)))
+        return img, scale
+
+    def __len__(
+        self,
+    ) -> int:
+        return len(self.dataset)
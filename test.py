@@ -4,22 +4,30 @@
 import os
 import argparse
 import yaml
-import math
 import numpy as np
 import cv2
 import random
 import torch
+import torch.utils.data as data
 import torch.backends.cudnn as cudnn
-from data import preproc_for_test
 from models.detector import Detector
 from utils import (
     Timer,
     SeqBoxMatcher,
     post_process,
+    split_detections,
     get_prior_box,
     get_model_complexity_info,
 )
-from data import COCODetection, VOCDetection, XMLDetection
+from data import (
+    COCODetection,
+    VOCDetection,
+    XMLDetection,
+    EvalDataset,
+    DataPrefetcher,
+    detection_collate,
+    normalize_for_test,
+)
 
 cudnn.benchmark = True
 
@@ -40,6 +48,10 @@ parser = argparse.ArgumentParser(description="Model Evluation")
 parser.add_argument("--config", type=str)
 parser.add_argument("--dataset", default="COCO", type=str)
 parser.add_argument("--trained_model", default=None, type=str)
+parser.add_argument("--eval_batch_size", default=16, type=int)
+parser.add_argument("--jit", action="store_true", help="TorchScript inference")
+parser.add_argument("--fp16", action="store_true", help="half precision inference")
+parser.add_argument("--cuda_graph", action="store_true", help="replay a CUDA graph")
 args = parser.parse_args()
 
 
@@ -97,6 +109,36 @@ if __name__ == "__main__":
     print("{:<30}  {:<8}".format("Computational complexity: ", flops))
     print("{:<30}  {:<8}".format("Number of parameters: ", params))
 
+    dtype = torch.half if args.fp16 else torch.float
+    model = model.to(dtype)
+    # persistent input buffer, every batch is copied (and cast) into it
+    inputs = torch.zeros(
+        args.eval_batch_size, 3, args.image_size, args.image_size
+    ).to(device="cuda", dtype=dtype)
+    mean = inputs.new_tensor((0.485, 0.456, 0.406)).view(1, 3, 1, 1)
+    std = inputs.new_tensor((0.229, 0.224, 0.225)).view(1, 3, 1, 1)
+
+    if args.jit:
+        print("Tracing model with TorchScript...")
+        example = torch.randn_like(inputs)
+        with torch.no_grad():
+            model = torch.jit.trace(model, example, strict=False)
+            model = torch.jit.optimize_for_inference(torch.jit.freeze(model))
+            for _ in range(3):  # warm up so the JIT specializes on the input shape
+                model(example)
+
+    if args.cuda_graph:
+        print("Capturing model with CUDA graph...")
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.no_grad(), torch.cuda.stream(stream):
+            for _ in range(3):  # warm up cudnn and the allocator off the capture
+                model(inputs)
+        torch.cuda.current_stream().wait_stream(stream)
+        graph = torch.cuda.CUDAGraph()
+        with torch.no_grad(), torch.cuda.graph(graph):
+            static_out = model(inputs)
+
     print("Preparing anchor boxes...")
     priors = get_prior_box(args.anchor_size, args.image_size).cuda()
 
@@ -106,65 +148,78 @@ if __name__ == "__main__":
     if args.seq_matcher:
         box_matcher = SeqBoxMatcher()
     if args.vis:
-        rgbs = dict()
-        os.makedirs("vis/", exist_ok=True)
-        os.makedirs("vis/{}/".format(args.dataset), exist_ok=True)
+        rgbs = {
+            j: [random.randint(0, 255) for _ in range(3)]
+            for j in range(testset.num_classes)
+        }
+        class_names = testset.pull_classes()
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        vis_dir = "vis/{}/".format(args.dataset)
+        os.makedirs(vis_dir, exist_ok=True)
+    test_loader = data.DataLoader(
+        EvalDataset(testset, args.image_size),
+        args.eval_batch_size,
+        shuffle=False,
+        num_workers=4,
+        collate_fn=detection_collate,
+        pin_memory=True,
+    )
     _t = {"im_detect": Timer(), "im_nms": Timer()}
-    for i in range(num_images):
+    prefetcher = DataPrefetcher(test_loader)
+    log_every = max(1, num_images // 10)
+    i = 0
+    for _ in range(len(test_loader)):
 
-        # prepare image to detect
-        img = testset.pull_image(i)
-        scale = torch.Tensor(
-            [img.shape[1], img.shape[0], img.shape[1], img.shape[0]]
-        ).cuda()
-        x = torch.from_numpy(preproc_for_test(img, args.image_size)).unsqueeze(0).cuda()
+        # prepare images to detect, the next uint8 batch is copied on a side stream
+        (images, scales) = prefetcher.next()
+        batch_size = images.size(0)
+        x = inputs[:batch_size]  # the last batch only fills the leading rows
+        normalize_for_test(images, x, mean, std)
 
         # model inference
         torch.cuda.current_stream().synchronize()
         _t["im_detect"].tic()
         with torch.no_grad():
-            out = model(x)
-        torch.cuda.current_stream().synchronize()
-        detect_time = _t["im_detect"].toc()
-
-        # post processing
-        _t["im_nms"].tic()
-        (boxes, scores) = post_process(
-            out,
-            priors,
-            scale,
-            eval_thresh=args.eval_thresh,
-            nms_thresh=args.nms_thresh,
-        )
-        if args.seq_matcher:
-            boxes, scores = box_matcher.update(boxes, scores)
-        for j in range(testset.num_classes):
-            inds = np.where(scores[:, j] > args.eval_thresh)[0]
-            if len(inds) == 0:
-                all_boxes[j][i] = np.empty([0, 5])
+            if args.cuda_graph:
+                graph.replay()
+                out = {k: v[:batch_size] for (k, v) in static_out.items()}
             else:
-                all_boxes[j][i] = np.hstack((boxes[inds], scores[inds, j : j + 1]))
-        nms_time = _t["im_nms"].toc()
+                out = model(x)
+        torch.cuda.current_stream().synchronize()
+        detect_time = _t["im_detect"].toc() / batch_size
+        out = {k: v.float() for (k, v) in out.items()}  # decode boxes in fp32
 
-        # vis bounding boxes on images
-        if args.vis:
+        for idx in range(batch_size):
+
+            # post processing
+            _t["im_nms"].tic()
+            (boxes, scores) = post_process(
+                {k: v[idx : idx + 1] for (k, v) in out.items()},
+                priors,
+                scales[idx],
+                eval_thresh=args.eval_thresh,
+                nms_thresh=args.nms_thresh,
+            )
+            if args.seq_matcher:
+                (boxes, scores) = box_matcher.update(
+                    boxes.cpu().numpy(), scores.cpu().numpy()
+                )
+                (boxes, scores) = torch.from_numpy(boxes), torch.from_numpy(scores)
+            c_dets = split_detections(boxes, scores, eval_thresh=args.eval_thresh)
             for j in range(testset.num_classes):
-                c_dets = all_boxes[j][i]
-                for line in c_dets[::-1]:
-                    x1, y1, x2, y2, score = (
-                        int(line[0]),
-                        int(line[1]),
-                        int(line[2]),
-                        int(line[3]),
-                        float(line[4]),
-                    )
-                    if score > 0.25:
-                        if j not in rgbs:
-                            r = random.randint(0, 255)
-                            g = random.randint(0, 255)
-                            b = random.randint(0, 255)
-                            rgbs[j] = [r, g, b]
-                        label = "{}{:.2f}".format(testset.pull_classes()[j], score)
+                all_boxes[j][i] = c_dets[j]
+            nms_time = _t["im_nms"].toc()
+
+            # vis bounding boxes on images
+            if args.vis:
+                img = testset.pull_image(i)
+                for j in range(testset.num_classes):
+                    c_dets = all_boxes[j][i][::-1]
+                    keep = c_dets[:, 4] > 0.25
+                    pts = c_dets[keep, :4].astype(np.int32)
+                    c_scores = c_dets[keep, 4]
+                    for (x1, y1, x2, y2), score in zip(pts.tolist(), c_scores.tolist()):
+                        label = "{}{:.2f}".format(class_names[j], score)
                         cv2.rectangle(img, (x1, y1), (x2, y2), rgbs[j], 2)
                         cv2.rectangle(
                             img, (x1, y1 - 15), (x1 + len(label) * 9, y1), rgbs[j], -1
@@ -173,41 +228,42 @@ if __name__ == "__main__":
                             img,
                             label,
                             (x1, y1 - 5),
-                            cv2.FONT_HERSHEY_SIMPLEX,
+                            font,
                             0.5,
                             (255, 255, 255),
                             1,
                             cv2.LINE_AA,
                         )
-            label = "MutualGuide ({}x{}) : {:.2f}ms on {}".format(
-                args.image_size,
-                args.image_size,
-                detect_time * 1000,
-                torch.cuda.get_device_name(0),
-            )
-            cv2.rectangle(img, (0, 0), (0 + len(label) * 9, 20), [0, 0, 0], -1)
-            cv2.putText(
-                img,
-                label,
-                (0, 15),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.5,
-                (0, 255, 255),
-                1,
-                cv2.LINE_AA,
-            )
-            filename = "vis/{}/{}.jpg".format(args.dataset, i)
-            cv2.imwrite(filename, img)
-
-        # logging
-        if i % math.floor(num_images / 10) == 0 and i > 0:
-            print(
-                "[{}/{}] model inference = {:.2f}ms, post process = {:.2f}ms,".format(
-                    i, num_images, detect_time * 1000, nms_time * 1000
+                label = "MutualGuide ({}x{}) : {:.2f}ms on {}".format(
+                    args.image_size,
+                    args.image_size,
+                    detect_time * 1000,
+                    torch.cuda.get_device_name(0),
                 )
-            )
-            _t["im_detect"].clear()
-            _t["im_nms"].clear()
+                cv2.rectangle(img, (0, 0), (0 + len(label) * 9, 20), [0, 0, 0], -1)
+                cv2.putText(
+                    img,
+                    label,
+                    (0, 15),
+                    font,
+                    0.5,
+                    (0, 255, 255),
+                    1,
+                    cv2.LINE_AA,
+                )
+                filename = os.path.join(vis_dir, "{}.jpg".format(i))
+                cv2.imwrite(filename, img)
+
+            # logging
+            if i and i % log_every == 0:
+                print(
+                    "[{}/{}] model inference = {:.2f}ms, post process = {:.2f}ms,".format(
+                        i, num_images, detect_time * 1000, nms_time * 1000,
+                    )
+                )
+                _t["im_detect"].clear()
+                _t["im_nms"].clear()
+            i += 1
 
     # evaluation
     testset.evaluate_detections(all_boxes)
@@ -4,6 +4,7 @@
 import os
 import yaml
 import argparse
+from concurrent.futures import Future, ThreadPoolExecutor
 import torch
 import torch.nn as nn
 import torch.optim as optim
@@ -23,7 +24,7 @@ from utils import (
     MultiBoxLoss,
     get_prior_box,
     tencent_trick,
-    adjust_learning_rate,
+    warmup_cosine_schedule,
 )
 import wandb
 
@@ -47,14 +48,33 @@ parser = argparse.ArgumentParser(description="Mutual Guide Training")
 parser.add_argument("--config", type=str)
 parser.add_argument("--dataset", default="COCO", type=str)
 parser.add_argument("--resume_ckpt", default=None, type=str)
+parser.add_argument("--num_workers", default=4, type=int)
+parser.add_argument("--prefetch_factor", default=2, type=int)
+parser.add_argument("--dali", action="store_true", help="GPU data loading with DALI")
+parser.add_argument("--compile", action="store_true", help="compile with torch.compile")
 args = parser.parse_args()
+executor = ThreadPoolExecutor(max_workers=1)
+
+
+def _to_cpu(
+    obj,
+):
+    """Snapshot (nested) tensors to host memory"""
+    if torch.is_tensor(obj):
+        obj = obj.detach()
+        return obj.clone() if obj.device.type == "cpu" else obj.cpu()
+    elif isinstance(obj, dict):
+        return {k: _to_cpu(v) for (k, v) in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(v) for v in obj)
+    return obj
 
 
 def save_model(
     model: nn.Module,
     iteration: int,
     suffix: str,
-) -> None:
+) -> Future:
     os.makedirs(args.save_folder, exist_ok=True)
     save_path = os.path.join(
         args.save_folder,
@@ -69,14 +89,16 @@ def save_model(
             suffix,
         ),
     )
-    tosave = {
-        "model": model.state_dict(),
-        "optimizer": optimizer.state_dict(),
-        "iteration": iteration,
-    }
+    # snapshot before returning, so that later updates do not race the writer
+    tosave = _to_cpu(
+        {
+            "model": model.state_dict(),
+            "optimizer": optimizer.state_dict(),
+            "iteration": iteration,
+        }
+    )
     print("Saving to {}".format(save_path))
-    torch.save(tosave, save_path)
-    return
+    return executor.submit(torch.save, tosave, save_path)
 
 
 if __name__ == "__main__":
@@ -115,6 +137,7 @@ if __name__ == "__main__":
         args.neck,
         mode="normal",
     ).cuda()
+    model = model.to(memory_format=torch.channels_last)
     ema_model = ModelEMA(model)
     optimizer = optim.SGD(
         tencent_trick(model),
@@ -124,6 +147,10 @@ if __name__ == "__main__":
         nesterov=True,
     )
     scaler = torch.cuda.amp.GradScaler()
+    # EMA, checkpoints and the optimizer keep using the eager module
+    forward = model
+    if args.compile:
+        forward = torch.compile(model, mode="reduce-overhead", dynamic=False)
 
     if args.resume_ckpt:
         print("Resuming checkpoint from", args.resume_ckpt)
@@ -148,44 +175,67 @@ if __name__ == "__main__":
             len(dataset),
         )
     )
+    if args.dali:
+        from data.dali_loader import DALICOCOLoader
+
+        if args.dataset != "COCO":
+            raise NotImplementedError("ERROR: DALI only supports COCO")
+        dali_loader = DALICOCOLoader(
+            dataset.root,
+            dataset.coco_name,
+            args.batch_size,
+            args.image_size,
+            num_threads=max(1, args.num_workers),
+        )
+    else:
+        # workers persist across epochs, each epoch only resets the iterator
+        rand_loader = data.DataLoader(
+            dataset,
+            args.batch_size,
+            shuffle=True,
+            num_workers=args.num_workers,
+            collate_fn=detection_collate,
+            pin_memory=True,
+            drop_last=True,
+            persistent_workers=args.num_workers > 0,
+            prefetch_factor=args.prefetch_factor if args.num_workers > 0 else None,
+        )
+    lrs = warmup_cosine_schedule(args.lr, args.warm_iter, end_iter)
     timer = Timer()
     epoch = -1
+    ckpt_future = None
     for iteration in range(start_iter, end_iter):
         
         if iteration % epoch_size == 0:
             epoch += 1
             print('epoch:', epoch)
             lam = epoch / args.max_epoch
-            # save checkpoint
-            save_model(ema_model.ema, iteration, "CKPT")
-
-            # create batch iterator
-            rand_loader = data.DataLoader(
-                dataset,
-                args.batch_size,
-                shuffle=True,
-                num_workers=4,
-                collate_fn=detection_collate,
-            )
-            prefetcher = DataPrefetcher(rand_loader)
+            # create batch iterator, before the writer thread starts, so
+            # that the loader workers are never forked from a threaded process
+            if args.dali:
+                prefetcher = dali_loader
+            else:
+                prefetcher = DataPrefetcher(rand_loader)
             model.train()
 
+            # save checkpoint in the background
+            if ckpt_future is not None:
+                ckpt_future.result()  # surface errors of the previous save
+            ckpt_future = save_model(ema_model.ema, iteration, "CKPT")
+
         # traning iteratoin
         timer.tic()
-        adjust_learning_rate(
-            optimizer,
-            args.lr,
-            iteration,
-            args.warm_iter,
-            end_iter,
-        )
+        lr = lrs[iteration]
+        for param_group in optimizer.param_groups:
+            param_group["lr"] = lr
         (images, targets) = prefetcher.next()
+        images = images.contiguous(memory_format=torch.channels_last)
 
         with torch.cuda.amp.autocast():
-            out = model(images)
+            out = forward(images)
             loss = criterion(out, priors, targets, lam)
 
-        optimizer.zero_grad()
+        optimizer.zero_grad(set_to_none=True)
         scaler.scale(loss).backward()
         scaler.step(optimizer)
         scaler.update()
@@ -198,7 +248,7 @@ if __name__ == "__main__":
                 "iter {}/{}, lr {:.6f}, loss {:.2f}, time {:.2f}s, eta {:.2f}h".format(
                     iteration,
                     end_iter,
-                    optimizer.param_groups[0]["lr"],
+                    lr,
                     loss.item(),
                     load_time,
                     load_time * (end_iter - iteration) / 3600,
@@ -208,4 +258,5 @@ if __name__ == "__main__":
             wandb.log({'loss': loss.item(), 'epoch': epoch})
 
     # model saving
-    save_model(ema_model.ema, iteration, "Final")
+    save_model(ema_model.ema, iteration, "Final").result()
+    executor.shutdown()
@@ -2,5 +2,5 @@ from .box import *
 from .loss import *
 from .timer import Timer
 from .ema import ModelEMA
-from .lr_scheduler import adjust_learning_rate, tencent_trick
+from .lr_scheduler import adjust_learning_rate, warmup_cosine_schedule, tencent_trick
 from .flops_counter import get_model_complexity_info
@@ -53,6 +53,18 @@ def jaccard(
     return inter / union  # [A,B]
 
 
+def _amplify_topk(
+    qualities: torch.Tensor,
+    topk: int,
+) -> None:
+    """Add 3 to the dynamic top-k qualities of each truth, without host syncs"""
+    (values, indices) = torch.topk(qualities, topk, dim=1, largest=True)
+    num_pos = values.sum(dim=1).int().clamp(min=1)
+    num_pos = torch.minimum(num_pos, (qualities > 0).sum(dim=1).int())
+    pos_mask = torch.arange(topk, device=qualities.device) < num_pos.unsqueeze(1)
+    qualities.scatter_add_(1, indices, pos_mask.to(qualities) * 3.0)
+
+
 @torch.no_grad()
 def match(
     truths: torch.Tensor,
@@ -68,8 +80,13 @@ def match(
     (best_truth_overlap, best_truth_idx) = overlaps.max(0)
     (best_prior_overlap, best_prior_idx) = overlaps.max(1)
     best_truth_overlap.index_fill_(0, best_prior_idx, 1)  # ensure best prior
-    for j in range(best_prior_idx.size(0)):
-        best_truth_idx[best_prior_idx[j]] = j
+    best_truth_idx.scatter_reduce_(  # the last truth wins on shared priors
+        0,
+        best_prior_idx,
+        torch.arange(best_prior_idx.size(0), device=best_prior_idx.device),
+        reduce="amax",
+        include_self=False,
+    )
     overlap_t[idx] = best_truth_overlap  # [num_priors] jaccord for each prior
     conf_t[idx] = labels[best_truth_idx]  # [num_priors] top class label for each prior
     loc_t[idx] = truths[best_truth_idx]  # Shape: [num_priors,4]
@@ -94,12 +111,8 @@ def mutual_match(
 
     ## for classification ###
     qualities = jaccard(truths, decode(regress, priors))
-    qualities[qualities != qualities.max(dim=0, keepdim=True)[0]] = 0.0
-    for quality in qualities:
-        num_pos = max(1, torch.topk(quality, topk, largest=True)[0].sum().int())
-        num_pos = min(num_pos, (quality > 0).sum())
-        pos_mask = torch.topk(quality, num_pos, largest=True)[1]
-        quality[pos_mask] += 3.0
+    qualities.masked_fill_(qualities != qualities.max(dim=0, keepdim=True)[0], 0.0)
+    _amplify_topk(qualities, topk)
     (best_truth_overlap, best_truth_idx) = qualities.max(dim=0)
     overlap_t[idx] = best_truth_overlap     # cls_w
     conf_t[idx] = labels[best_truth_idx]    # cls_t
@@ -109,12 +122,8 @@ def mutual_match(
         jaccard(truths, point_form(priors))
         * torch.exp(classif.sigmoid().t()[labels, :] / sigma)
     ).clamp_(max=1)
-    qualities[qualities != qualities.max(dim=0, keepdim=True)[0]] = 0.0
-    for quality in qualities:
-        num_pos = max(1, torch.topk(quality, topk, largest=True)[0].sum().int())
-        num_pos = min(num_pos, (quality > 0).sum())
-        pos_mask = torch.topk(quality, num_pos, largest=True)[1]
-        quality[pos_mask] += 3.0
+    qualities.masked_fill_(qualities != qualities.max(dim=0, keepdim=True)[0], 0.0)
+    _amplify_topk(qualities, topk)
     (best_truth_overlap, best_truth_idx) = qualities.max(dim=0)
     pred_t[idx] = best_truth_overlap        # loc_w
     loc_t[idx] = truths[best_truth_idx]
@@ -139,12 +148,8 @@ def iou2classif_match(
 
     ## for classification ###
     qualities = jaccard(truths, decode(regress, priors))
-    qualities[qualities != qualities.max(dim=0, keepdim=True)[0]] = 0.0
-    for quality in qualities:
-        num_pos = max(1, torch.topk(quality, topk, largest=True)[0].sum().int())
-        num_pos = min(num_pos, (quality > 0).sum())
-        pos_mask = torch.topk(quality, num_pos, largest=True)[1]
-        quality[pos_mask] += 3.0
+    qualities.masked_fill_(qualities != qualities.max(dim=0, keepdim=True)[0], 0.0)
+    _amplify_topk(qualities, topk)
     (best_truth_overlap, best_truth_idx) = qualities.max(dim=0)
     overlap_t[idx] = best_truth_overlap     # cls_w
     conf_t[idx] = labels[best_truth_idx]    # cls_t
@@ -160,12 +165,8 @@ def iou2classif_match(
     qualities = (
         (1 - lam)*iou + lam * confidence
     ).clamp_(max=1)
-    qualities[qualities != qualities.max(dim=0, keepdim=True)[0]] = 0.0 # 최대 빼고 다 0
-    for quality in qualities:
-        num_pos = max(1, torch.topk(quality, topk, largest=True)[0].sum().int())
-        num_pos = min(num_pos, (quality > 0).sum())
-        pos_mask = torch.topk(quality, num_pos, largest=True)[1]
-        quality[pos_mask] += 3.0
+    qualities.masked_fill_(qualities != qualities.max(dim=0, keepdim=True)[0], 0.0) # 최대 빼고 다 0
+    _amplify_topk(qualities, topk)
     (best_truth_overlap, best_truth_idx) = qualities.max(dim=0)
     pred_t[idx] = best_truth_overlap        # loc_w
     loc_t[idx] = truths[best_truth_idx]
@@ -193,11 +194,7 @@ def combined_match(
         jaccard(truths, decode(regress, priors))
         * torch.exp(classif.sigmoid().t()[labels, :] / sigma)
     ).clamp_(max=1)
-    for quality in qualities:
-        num_pos = max(1, torch.topk(quality, topk, largest=True)[0].sum().int())
-        num_pos = min(num_pos, (quality > 0).sum())
-        pos_mask = torch.topk(quality, num_pos, largest=True)[1]
-        quality[pos_mask] += 3.0   
+    _amplify_topk(qualities, topk)
     (best_truth_overlap, best_truth_idx) = qualities.max(dim=0)
     loc_t[idx] = truths[best_truth_idx]
     conf_t[idx] = labels[best_truth_idx]
@@ -2,9 +2,23 @@
 # -*- coding: utf-8 -*-
 
 import torch
-import torchvision
 import numpy as np
-from .box_utils import decode
+from .box_utils import decode, jaccard
+
+
+def fast_nms(
+    boxes: torch.Tensor,
+    scores: torch.Tensor,
+    iou_thresh: float = 0.5,
+    top_k: int = 5000,
+) -> torch.Tensor:
+    """Vectorized Fast NMS (YOLACT), suppressed boxes may still suppress others"""
+
+    top_k = min(top_k, scores.size(0))
+    (scores, order) = scores.topk(top_k)  # bound the [top_k, top_k] iou matrix
+    iou = jaccard(boxes[order], boxes[order]).triu_(diagonal=1)
+    keep = iou.max(dim=0)[0] < iou_thresh
+    return order[keep]
 
 
 def post_process(
@@ -29,13 +43,31 @@ def post_process(
 
     keep = conf.max(1)[0] > eval_thresh
     if not keep.any():
-        return (np.empty([0, 4]), np.empty([0, num_classes]))
+        return (loc.new_empty([0, 4]), conf.new_empty([0, num_classes]))
     loc = loc[keep]
     conf = conf[keep]
 
-    keep = torchvision.ops.nms(loc, conf.max(1)[0], iou_threshold=nms_thresh)
+    keep = fast_nms(loc, conf.max(1)[0], iou_thresh=nms_thresh)
     loc = loc[keep]
     conf = conf[keep]
-
-    (loc, conf) = loc.cpu().numpy(), conf.cpu().numpy()
     return (loc, conf)
+
+
+def split_detections(
+    boxes: torch.Tensor,
+    scores: torch.Tensor,
+    eval_thresh: float = 0.05,
+) -> list:
+    """Threshold all classes at once and split detections per class"""
+
+    num_classes = scores.size(1)
+    (idxs, cls) = (scores > eval_thresh).nonzero(as_tuple=True)
+    (cls, order) = cls.sort(stable=True)
+    idxs = idxs[order]
+    dets = torch.cat(
+        (boxes[idxs], scores[idxs, cls].unsqueeze(1), cls.unsqueeze(1).to(boxes)), 1
+    )
+
+    dets = dets.cpu().numpy()  # single device to host copy per image
+    counts = np.bincount(dets[:, 5].astype(np.int64), minlength=num_classes)
+    return np.split(dets[:, :5], np.cumsum(counts)[:-1])
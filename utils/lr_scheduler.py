@@ -6,27 +6,52 @@ import torch
 import torch.nn as nn
 
 
-def adjust_learning_rate(
-    optimizer: torch.optim,
+def _warmup_cosine_lr(
     base_lr: float,
     iteration: int,
     warm_iter: int,
     max_iter: int,
     min_lr_ratio: float = 0.05,
 ) -> float:
-    """warmup + cosine lr decay"""
+    """warmup + cosine lr at one iteration"""
     start_lr = base_lr * min_lr_ratio
     if iteration <= warm_iter:
-        lr = start_lr + (base_lr - start_lr) * iteration / warm_iter
+        lr = start_lr + (base_lr - start_lr) * iteration / max(warm_iter, 1)
     else:
         lr = start_lr + (base_lr - start_lr) * 0.5 * (
             1.0 + math.cos(math.pi * (iteration - warm_iter) / (max_iter - warm_iter))
         )
+    return lr
+
+
+def adjust_learning_rate(
+    optimizer: torch.optim,
+    base_lr: float,
+    iteration: int,
+    warm_iter: int,
+    max_iter: int,
+    min_lr_ratio: float = 0.05,
+) -> float:
+    """warmup + cosine lr decay"""
+    lr = _warmup_cosine_lr(base_lr, iteration, warm_iter, max_iter, min_lr_ratio)
     for param_group in optimizer.param_groups:
         param_group["lr"] = lr
     return lr
 
 
+def warmup_cosine_schedule(
+    base_lr: float,
+    warm_iter: int,
+    max_iter: int,
+    min_lr_ratio: float = 0.05,
+) -> list:
+    """warmup + cosine lr decay, precomputed for every iteration"""
+    return [
+        _warmup_cosine_lr(base_lr, iteration, warm_iter, max_iter, min_lr_ratio)
+        for iteration in range(max_iter)
+    ]
+
+
 def tencent_trick(
     model: nn.Module,
 ) -> list: